@@ -1,16 +1,27 @@
 import requests
 import json
 import csv
+import gzip
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+try:
+    import pandas as pd
+except ImportError:  # optional, only speeds up rebuild_daily_summary
+    pd = None
+
 # =======================
 # CONFIG
 # =======================
 
-URL = "https://www.ksndmc.org/default.aspx/DailyReport/getLast15MinutesWeather?drpVal=29"
+URL_TEMPLATE = "https://www.ksndmc.org/default.aspx/DailyReport/getLast15MinutesWeather?drpVal={}"
+
+# drpVal codes to poll; fetched concurrently over the shared session
+DRP_VALUES = [29]
 
 HEADERS = {
     "accept": "application/json, text/javascript, */*; q=0.01",
@@ -21,37 +32,47 @@ HEADERS = {
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
 
-RAW_LOG_FILE = DATA_DIR / "raw_api_log.jsonl"
+# Raw logs are gzip-appended and rotated daily: raw_api_log-YYYYMMDD.jsonl.gz
+RAW_LOG_PREFIX = "raw_api_log"
 HISTORY_FILE = DATA_DIR / "temperature_history.csv"
 DAILY_SUMMARY_FILE = DATA_DIR / "daily_summary.csv"
+DAILY_STATE_FILE = DATA_DIR / "daily_state.json"
+# Record keys seen on the previous run; consecutive polls overlap
+LAST_SEEN_FILE = DATA_DIR / ".last_seen.json"
+
+# History size above which rebuilds go through pandas (when installed)
+PANDAS_REBUILD_MIN_BYTES = 1_000_000
 
 # =======================
 # FETCH WITH RETRIES
 # =======================
 
-def fetch_weather_data():
-    session = requests.Session()
-
-    retries = Retry(
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
         total=5,
         backoff_factor=3,
         status_forcelist=[500, 502, 503, 504],
         allowed_methods=["POST"]
     )
+))
 
-    adapter = HTTPAdapter(max_retries=retries)
-    session.mount("https://", adapter)
 
+def fetch_region(drp_val):
     try:
-        response = session.post(
-            URL,
-            headers=HEADERS,
+        response = _SESSION.post(
+            URL_TEMPLATE.format(drp_val),
             timeout=(5, 20)  # connect timeout, read timeout
         )
         response.raise_for_status()
 
-        # KSNDMC returns JSON string inside JSON
-        outer = json.loads(response.text)
+        # KSNDMC returns JSON string inside JSON. Release the raw body before
+        # decoding the inner document so both copies are never alive at once.
+        outer = json.loads(response.content)
+        del response
         payload = json.loads(outer)
 
         if not isinstance(payload, list):
@@ -60,21 +81,35 @@ def fetch_weather_data():
         return payload
 
     except Exception as e:
-        print("⚠️ KSNDMC API unreachable or slow:", str(e))
+        print(f"⚠️ KSNDMC API unreachable or slow (drpVal={drp_val}):", str(e))
+        return None
+
+
+def fetch_weather_data():
+    with ThreadPoolExecutor(max_workers=len(DRP_VALUES)) as pool:
+        results = list(pool.map(fetch_region, DRP_VALUES))
+
+    payloads = [p for p in results if p is not None]
+
+    if not payloads:
         return None
 
+    return [r for p in payloads for r in p]
+
 
 # =======================
 # RAW LOG STORAGE
 # =======================
 
-def append_raw_log(payload):
+def append_raw_log(payload, fetched_at):
     record = {
-        "fetched_at": datetime.now(timezone.utc).isoformat(),
+        "fetched_at": fetched_at.isoformat(),
         "records": payload
     }
 
-    with RAW_LOG_FILE.open("a", encoding="utf-8") as f:
+    path = DATA_DIR / f"{RAW_LOG_PREFIX}-{fetched_at:%Y%m%d}.jsonl.gz"
+
+    with gzip.open(path, "at", compresslevel=3, encoding="utf-8") as f:
         f.write(json.dumps(record) + "\n")
 
 
@@ -83,13 +118,34 @@ def append_raw_log(payload):
 # =======================
 
 def append_temperature_history(payload):
-    file_exists = HISTORY_FILE.exists()
-
-    with HISTORY_FILE.open("a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-
-        if not file_exists:
-            writer.writerow([
+    # RECORDED_DATE is ISO-8601 ("YYYY-MM-DDTHH:MM:SS"), so the date is
+    # just its first 10 characters; check the shape once per batch
+    if payload:
+        raw = payload[0]["RECORDED_DATE"]
+        if len(raw) < 10 or raw[4] != "-" or raw[7] != "-":
+            raise ValueError(f"Unexpected RECORDED_DATE format: {raw!r}")
+
+    keys = [
+        f'{r["RECORDED_DATE"][:10]}|{r["RECORDED_TIME"]}|{r["DISTRICT"]}|{r["STATION_NAME"]}'
+        for r in payload
+    ]
+
+    last_seen = set()
+    if LAST_SEEN_FILE.exists():
+        with LAST_SEEN_FILE.open("r", encoding="utf-8") as f:
+            last_seen = set(json.load(f))
+
+    new_rows = []
+    for key, r in zip(keys, payload):
+        if key not in last_seen:
+            last_seen.add(key)  # also drops repeats within this payload
+            new_rows.append(r)
+
+    # "x" only succeeds for whoever creates the file, so the header is
+    # written exactly once without a separate exists() check
+    try:
+        with HISTORY_FILE.open("x", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow([
                 "date",
                 "time",
                 "district",
@@ -97,44 +153,62 @@ def append_temperature_history(payload):
                 "station",
                 "temperature"
             ])
+    except FileExistsError:
+        pass
 
-        for r in payload:
-            recorded_dt = datetime.fromisoformat(r["RECORDED_DATE"])
-
-            writer.writerow([
-                recorded_dt.date().isoformat(),
+    with HISTORY_FILE.open("a", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        writer = csv.writer(f)
+        writer.writerows(
+            (
+                r["RECORDED_DATE"][:10],
                 r["RECORDED_TIME"],
                 r["DISTRICT"],
                 r["TALUKNAME"],
                 r["STATION_NAME"],
                 r["TEMPERATURE"]
-            ])
+            )
+            for r in new_rows
+        )
+
+    with LAST_SEEN_FILE.open("w", encoding="utf-8") as f:
+        json.dump(sorted(set(keys)), f)
+
+    return new_rows
 
 
 # =======================
 # DAILY MIN / MAX
 # =======================
 
-def recompute_daily_summary():
-    aggregates = {}
+# Running max/min per (date, station), kept as JSON so steady-state runs
+# never have to re-parse the summary CSV
+def _load_state():
+    with DAILY_STATE_FILE.open("r", encoding="utf-8") as f:
+        state = json.load(f)
 
-    if not HISTORY_FILE.exists():
-        return
+    return {
+        tuple(key.split("|", 1)): values
+        for key, values in state.items()
+    }
 
-    with HISTORY_FILE.open("r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
 
-        for row in reader:
-            key = (row["date"], row["station"])
-            temp = float(row["temperature"])
+def _save_state(aggregates):
+    state = {
+        f"{date}|{station}": values
+        for (date, station), values in aggregates.items()
+    }
 
-            if key not in aggregates:
-                aggregates[key] = {"max": temp, "min": temp}
-            else:
-                aggregates[key]["max"] = max(aggregates[key]["max"], temp)
-                aggregates[key]["min"] = min(aggregates[key]["min"], temp)
+    # Write-then-rename so a crash never leaves a truncated file behind
+    tmp = DAILY_STATE_FILE.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(state, f)
 
-    with DAILY_SUMMARY_FILE.open("w", newline="", encoding="utf-8") as f:
+    tmp.replace(DAILY_STATE_FILE)
+
+
+def _write_daily_summary(aggregates):
+    tmp = DAILY_SUMMARY_FILE.with_suffix(".tmp")
+    with tmp.open("w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerow([
             "date",
@@ -147,10 +221,106 @@ def recompute_daily_summary():
             writer.writerow([
                 date,
                 town,
-                values["max"],
-                values["min"]
+                values[0],
+                values[1]
             ])
 
+    tmp.replace(DAILY_SUMMARY_FILE)
+
+
+# Full rescan of the history CSV, for one-shot repair of the summary
+def rebuild_daily_summary():
+    if not HISTORY_FILE.exists():
+        return
+
+    if pd is not None and HISTORY_FILE.stat().st_size > PANDAS_REBUILD_MIN_BYTES:
+        aggregates = _aggregate_history_pandas()
+    else:
+        aggregates = _aggregate_history()
+
+    _save_state(aggregates)
+    _write_daily_summary(aggregates)
+
+
+def _aggregate_history_pandas():
+    df = pd.read_csv(
+        HISTORY_FILE,
+        usecols=["date", "station", "temperature"],
+        dtype={"date": str, "station": str, "temperature": "float64"},
+        keep_default_na=False
+    )
+    summary = df.groupby(["date", "station"])["temperature"].agg(["max", "min"])
+
+    return {
+        (date, station): [float(mx), float(mn)]
+        for (date, station), mx, mn in summary.itertuples(name=None)
+    }
+
+
+def _aggregate_history():
+    aggregates = {}
+    get = aggregates.get
+    # Dates and station names repeat on every poll; interning shares one
+    # string (and its cached hash) per distinct value
+    intern = sys.intern
+
+    with HISTORY_FILE.open("r", encoding="utf-8", buffering=1 << 20) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return aggregates
+
+        date_i = header.index("date")
+        station_i = header.index("station")
+        temp_i = header.index("temperature")
+
+        for row in reader:
+            key = (intern(row[date_i]), intern(row[station_i]))
+            temp = float(row[temp_i])
+
+            values = get(key)
+            if values is None:
+                aggregates[key] = [temp, temp]
+            elif temp > values[0]:
+                values[0] = temp
+            elif temp < values[1]:
+                values[1] = temp
+
+    return aggregates
+
+
+# Fold only the freshly fetched records into the existing summary
+def update_daily_summary(payload):
+    if not DAILY_STATE_FILE.exists():
+        # First run (or state deleted): the history already holds payload
+        rebuild_daily_summary()
+        return
+
+    aggregates = _load_state()
+    dirty = False
+
+    for r in payload:
+        key = (r["RECORDED_DATE"][:10], r["STATION_NAME"])
+        temp = float(r["TEMPERATURE"])
+
+        values = aggregates.get(key)
+        if values is None:
+            aggregates[key] = [temp, temp]
+            dirty = True
+        elif temp > values[0]:
+            values[0] = temp
+            dirty = True
+        elif temp < values[1]:
+            values[1] = temp
+            dirty = True
+
+    # Most polls don't move any daily extreme; leave both files untouched
+    if not dirty and DAILY_SUMMARY_FILE.exists():
+        return
+
+    _save_state(aggregates)
+    _write_daily_summary(aggregates)
+
 
 # =======================
 # MAIN (FAIL-SAFE)
@@ -163,12 +333,15 @@ def main():
         print("Skipping this run due to API failure")
         return  # DO NOT fail the workflow
 
-    append_raw_log(payload)
-    append_temperature_history(payload)
-    recompute_daily_summary()
+    now = datetime.now(timezone.utc)
+
+    append_raw_log(payload, now)
+    new_rows = append_temperature_history(payload)
+    update_daily_summary(new_rows)
 
-    print(f"Run successful @ {datetime.now().isoformat()}")
+    print(f"Run successful @ {now.isoformat()}")
     print(f"Records fetched: {len(payload)}")
+    print(f"New records: {len(new_rows)}")
 
 
 if __name__ == "__main__":